@@ -2,39 +2,75 @@
 # ArXiv论文追踪与分析器
 
 import os
+import re
+import json
+import asyncio
+import aiohttp
 import arxiv
 import datetime
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import itertools
 from pathlib import Path
 import openai
+import markdown
 import time
 import logging
 import sys
+import shutil
 import smtplib
+import tempfile
+from urllib.parse import urlparse
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from jinja2 import Template
 
-# 加载环境变量
-load_dotenv()
-
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
                    handlers=[logging.StreamHandler(sys.stdout)])
 logger = logging.getLogger(__name__)
 
 # 配置
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-SMTP_SERVER = os.getenv("SMTP_SERVER")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USERNAME = os.getenv("SMTP_USERNAME")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-EMAIL_FROM = os.getenv("EMAIL_FROM")
-# 支持多个收件人邮箱，用逗号分隔
-EMAIL_TO = [email.strip() for email in os.getenv("EMAIL_TO", "").split(",") if email.strip()]
+@dataclasses.dataclass(frozen=True)
+class Config:
+    """从环境变量（及.env文件）读取的运行配置"""
+    openai_api_key: str | None
+    smtp_server: str | None
+    smtp_port: int
+    smtp_use_ssl: bool
+    smtp_username: str | None
+    smtp_password: str | None
+    email_from: str | None
+    email_to: tuple
+
+@functools.lru_cache(maxsize=1)
+def get_config():
+    """首次调用时加载环境变量并解析配置，之后复用同一个Config对象
+    
+    仅导入本模块时不读取.env，也不访问环境变量
+    """
+    # 加载环境变量
+    load_dotenv()
+    # SMTP_USE_SSL开启时直接建立TLS连接（默认端口465），省去STARTTLS升级的往返
+    smtp_use_ssl = os.getenv("SMTP_USE_SSL", "").strip().lower() in ("1", "true", "yes")
+    return Config(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        smtp_server=os.getenv("SMTP_SERVER"),
+        smtp_port=int(os.getenv("SMTP_PORT") or ("465" if smtp_use_ssl else "587")),
+        smtp_use_ssl=smtp_use_ssl,
+        smtp_username=os.getenv("SMTP_USERNAME"),
+        smtp_password=os.getenv("SMTP_PASSWORD"),
+        email_from=os.getenv("EMAIL_FROM"),
+        # 支持多个收件人邮箱，用逗号分隔
+        email_to=tuple(email.strip() for email in os.getenv("EMAIL_TO", "").split(",") if email.strip()),
+    )
 
 PAPERS_DIR = Path("./papers")
 CONCLUSION_FILE = Path("./conclusion.md")
+ANALYZED_INDEX_FILE = Path("./analyzed.json")  # 已分析论文ID索引，避免每次运行都重新扫描conclusion.md
 # 配置不同领域的类别
 CATEGORY_CONFIGS = {
     "软件工程": {
@@ -53,73 +89,257 @@ CATEGORY_CONFIGS = {
 CATEGORIES = CATEGORY_CONFIGS["软件工程"]["categories"]  
 MAX_PAPERS_SEARCH = 30  # 每个领域搜索的论文数量
 MAX_PAPERS_ANALYZE = 5  # 每个领域分析的论文数量
+ARXIV_DELAY_SECONDS = 3  # arXiv API要求的请求间隔（秒）
+ARXIV_MAX_PAGE_SIZE = 2000  # arXiv API单次请求允许返回的最大结果数
+ARXIV_NUM_RETRIES = 3  # arXiv API请求失败时的重试次数
+DOWNLOAD_CONCURRENCY = 4  # 同时下载的PDF数量上限，避免触发arXiv的速率限制
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # 流式下载PDF时每次读取的字节数
+PDF_DOWNLOAD_DOMAIN = "export.arxiv.org"  # arXiv推荐程序化访问使用的镜像域名
+ANALYZE_CONCURRENCY = 5  # 同时进行的OpenAI请求数量上限，按账户RPM额度调整
+ANALYZE_MAX_RETRIES = 3  # 触发速率限制时的最大重试次数
+ANALYZE_RPM = 60  # 每分钟最多发起的OpenAI请求数，按账户RPM额度调整
+ANALYZE_BATCH_SIZE = 5  # 每次OpenAI请求合并分析的论文数量
+ANALYZE_MODEL = "gpt-4.1-mini"
+ANALYSIS_CACHE_DIR = Path("./cache/analyses")  # OpenAI分析结果的本地缓存目录
+ANALYSIS_CACHE_TTL = 7 * 24 * 3600  # 缓存有效期（秒），与论文搜索的时间范围一致
+
+ANALYSIS_SYSTEM_PROMPT = "You are a research assistant specialized in summarizing and analyzing academic papers. Please provide structured, comprehensive analysis in English."
+
+# 论文分析的输出格式要求，单篇分析和批量分析共用
+ANALYSIS_FORMAT_PROMPT = """#### Executive Summary
+Write 2-3 sentences summarizing the core problem, approach, and main result.
+
+### Key Contributions
+- List 2-3 main contributions (one line each)
+- Focus on what's genuinely novel
+
+### Method & Results
+- Core methodology in 1-2 bullet points
+- Key datasets/tools used (if any)
+- Main experimental results (quantitative when possible)
+- Performance compared to baselines (if reported)
+
+### Impact & Limitations
+- Practical significance (1-2 sentences)
+- Main limitations or future work directions (1-2 points)
+
+Keep the entire analysis under 200 words. Be precise and avoid redundancy. Use bullet points for clarity."""
+
+# 批量分析的结构化输出格式：{"analyses": [{"id": ..., "analysis": ...}, ...]}
+ANALYSIS_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "paper_analyses",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "analyses": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            "analysis": {"type": "string"}
+                        },
+                        "required": ["id", "analysis"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["analyses"],
+            "additionalProperties": False
+        }
+    }
+}
 
-# 配置OpenAI API
-openai.api_key = OPENAI_API_KEY
+# 邮件HTML模板（规范化标题样式），在导入时编译一次
+_HTML_TEMPLATE_STR = """
+<html>
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
+            line-height: 1.6;
+            max-width: 1000px;
+            margin: 0 auto;
+            padding: 20px;
+            background-color: #f5f5f5;
+            color: #333;
+        }
+        .container {
+            background-color: white;
+            padding: 30px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }
+        /* 规范化标题样式 - 确保一致的字体大小 */
+        h1 {
+            color: #2c3e50;
+            font-size: 24px;
+            border-bottom: 2px solid #3498db;
+            padding-bottom: 10px;
+            margin: 30px 0 20px 0;
+        }
+        h2 {
+            color: #34495e;
+            font-size: 20px;
+            margin: 25px 0 15px 0;
+            padding-bottom: 8px;
+            border-bottom: 1px solid #eee;
+        }
+        h3 {
+            color: #2980b9;
+            font-size: 18px;
+            margin: 20px 0 10px 0;
+        }
+        h4 {
+            color: #2c3e50;
+            font-size: 16px;
+            margin: 15px 0 10px 0;
+            font-weight: 600;
+        }
+        .paper-header {
+            background-color: #f8f9fa;
+            padding: 15px;
+            border-left: 4px solid #3498db;
+            margin: 20px 0;
+            border-radius: 4px;
+        }
+        .paper-info {
+            margin: 5px 0;
+            font-size: 14px;
+        }
+        .paper-info strong {
+            color: #2c3e50;
+        }
+        a {
+            color: #3498db;
+            text-decoration: none;
+        }
+        a:hover {
+            text-decoration: underline;
+        }
+        hr {
+            border: none;
+            border-top: 1px solid #eee;
+            margin: 30px 0;
+        }
+        ul, ol {
+            margin: 10px 0;
+            padding-left: 20px;
+        }
+        li {
+            margin: 5px 0;
+        }
+        .section-content {
+            margin-bottom: 20px;
+        }
+        strong {
+            color: #2c3e50;
+            font-weight: 600;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        {{ content }}
+    </div>
+</body>
+</html>
+"""
+_EMAIL_TEMPLATE = Template(_HTML_TEMPLATE_STR)
 
-# 如果不存在论文目录则创建
-PAPERS_DIR.mkdir(exist_ok=True)
-logger.info(f"论文将保存在: {PAPERS_DIR.absolute()}")
-logger.info(f"分析结果将写入: {CONCLUSION_FILE.absolute()}")
+# 预编译的正则表达式
+_ARXIV_LINK_RE = re.compile(r'https?://arxiv\.org/abs/([^)\s\n]+)')
+_PAPER_ID_RE = re.compile(r'arxiv:([^)\s\n]+)')
+_PAPER_REF_RE = re.compile(rf'{_ARXIV_LINK_RE.pattern}|{_PAPER_ID_RE.pattern}')
+
+def make_arxiv_client(max_results):
+    """创建arXiv客户端，页大小覆盖max_results，使一次HTTP请求即可取回全部结果
+    
+    arxiv库默认的query_url_format已指向export.arxiv.org，无需另行设置
+    """
+    client = arxiv.Client(page_size=min(max_results, ARXIV_MAX_PAGE_SIZE),
+                          delay_seconds=ARXIV_DELAY_SECONDS,
+                          num_retries=ARXIV_NUM_RETRIES)
+    return client
+
+def _search_recent_papers(client, query, max_results, recent_cutoff):
+    """按提交时间降序检索论文，边翻页边过滤出recent_cutoff之后发布的论文"""
+    search = arxiv.Search(
+        query=query,
+        max_results=max_results,
+        sort_by=arxiv.SortCriterion.SubmittedDate,
+        sort_order=arxiv.SortOrder.Descending
+    )
+    
+    # 生成器按需请求，取满max_results即停止拉取
+    recent_papers = []
+    for paper in itertools.islice(client.results(search), max_results):
+        # 移除时区信息进行比较
+        paper_date = paper.published.replace(tzinfo=None)
+        # 结果按提交时间降序排列，遇到第一篇过期论文即可停止，后续页不再请求
+        if paper_date < recent_cutoff:
+            break
+        recent_papers.append(paper)
+    return recent_papers
 
 def get_recent_papers(categories, max_results=MAX_PAPERS_SEARCH):
     """获取最近发布的指定类别的论文"""
+    # 过滤最近几天的论文
+    today = datetime.datetime.now()
+    recent_cutoff = today - datetime.timedelta(days=7)  # 扩大到7天
+    client = make_arxiv_client(max_results)
+    
     try:
         # 简化查询，只按类别搜索，避免复杂的日期范围查询
         category_query = " OR ".join([f"cat:{cat}" for cat in categories])
         
         logger.info(f"正在搜索论文，查询条件: {category_query}")
-        
-        # 使用新的Client API
-        client = arxiv.Client()
-        search = arxiv.Search(
-            query=category_query,
-            max_results=max_results,
-            sort_by=arxiv.SortCriterion.SubmittedDate,
-            sort_order=arxiv.SortOrder.Descending
-        )
-        
-        results = list(client.results(search))
-        logger.info(f"找到{len(results)}篇符合条件的论文")
-        
-        # 过滤最近几天的论文
-        today = datetime.datetime.now()
-        recent_cutoff = today - datetime.timedelta(days=7)  # 扩大到7天
-        
-        recent_papers = []
-        for paper in results:
-            # 确保published字段是datetime对象
-            if hasattr(paper.published, 'replace'):
-                # 移除时区信息进行比较
-                paper_date = paper.published.replace(tzinfo=None)
-                if paper_date >= recent_cutoff:
-                    recent_papers.append(paper)
+        recent_papers = _search_recent_papers(client, category_query, max_results, recent_cutoff)
         
         logger.info(f"最近7天内发布的论文: {len(recent_papers)}篇")
         return recent_papers
         
     except Exception as e:
         logger.error(f"搜索论文时发生错误: {str(e)}")
-        # 如果搜索失败，尝试更简单的查询
+    
+    # 如果合并查询失败，逐个类别分别查询，单个类别失败不影响其他类别
+    logger.info("尝试按类别分别查询...")
+    papers_by_id = {}
+    for category in categories:
         try:
-            logger.info("尝试简化查询...")
-            client = arxiv.Client()
-            search = arxiv.Search(
-                query=categories[0],  # 只搜索第一个类别
-                max_results=max_results,
-                sort_by=arxiv.SortCriterion.SubmittedDate,
-                sort_order=arxiv.SortOrder.Descending
-            )
-            results = list(client.results(search))
-            logger.info(f"简化查询找到{len(results)}篇论文")
-            return results[:max_results]  # 返回限定数量的结果
-        except Exception as e2:
-            logger.error(f"简化查询也失败: {str(e2)}")
-            return []
-
-def download_paper(paper, output_dir):
-    """将论文PDF下载到指定目录"""
+            for paper in _search_recent_papers(client, f"cat:{category}", max_results, recent_cutoff):
+                # 跨类别发布的论文只保留一份
+                papers_by_id.setdefault(paper.entry_id, paper)
+        except Exception as e:
+            logger.error(f"查询类别{category}失败: {str(e)}")
+    
+    recent_papers = sorted(papers_by_id.values(), key=lambda p: p.published, reverse=True)
+    logger.info(f"按类别分别查询找到最近7天内发布的论文: {len(recent_papers)}篇")
+    return recent_papers
+
+_author_names_cache = {}
+
+def format_authors(paper):
+    """返回逗号分隔的作者名，按entry_id缓存，同一篇论文只从Author对象中提取一次"""
+    names = _author_names_cache.get(paper.entry_id)
+    if names is None:
+        names = _author_names_cache[paper.entry_id] = ', '.join(author.name for author in paper.authors)
+    return names
+
+def get_pdf_url(paper):
+    """获取论文PDF链接，并将域名替换为export.arxiv.org"""
+    return urlparse(paper.pdf_url)._replace(netloc=PDF_DOWNLOAD_DOMAIN).geturl()
+
+async def download_paper_async(session, paper, output_dir):
+    """异步将论文PDF下载到指定目录"""
     pdf_path = output_dir / f"{paper.get_short_id().replace('/', '_')}.pdf"
+    # 分块流式写入临时文件，下载完整后再重命名，避免中断的下载被当作已下载
+    part_path = pdf_path.with_name(pdf_path.name + '.part')
     
     # 如果已下载则跳过
     if pdf_path.exists():
@@ -128,172 +348,481 @@ def download_paper(paper, output_dir):
     
     try:
         logger.info(f"正在下载: {paper.title}")
-        paper.download_pdf(filename=str(pdf_path))
+        async with session.get(get_pdf_url(paper)) as response:
+            response.raise_for_status()
+            with open(part_path, 'wb') as f:
+                while chunk := await response.content.read(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        os.replace(part_path, pdf_path)
         logger.info(f"已下载到 {pdf_path}")
         return pdf_path
     except Exception as e:
         logger.error(f"下载论文失败 {paper.title}: {str(e)}")
+        part_path.unlink(missing_ok=True)
         return None
 
-def analyze_paper_with_chatgpt(pdf_path, paper):
-    """使用ChatGPT API分析论文（使用OpenAI 0.28.0兼容格式）"""
+async def download_papers(papers, output_dir):
+    """并发下载多篇论文的PDF，返回与papers顺序一致的PDF路径列表（失败为None）"""
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    
+    async def bounded_download(session, paper):
+        async with semaphore:
+            return await download_paper_async(session, paper, output_dir)
+    
+    # 共享一个会话，复用TCP/TLS连接
+    connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        return await asyncio.gather(*[bounded_download(session, paper) for paper in papers])
+
+class AsyncRateLimiter:
+    """异步令牌桶限流器：每time_period秒最多放行max_rate次，令牌充足时不等待"""
+    
+    def __init__(self, max_rate, time_period=60):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = float(max_rate)
+        self._last_refill = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_rate,
+                           self._tokens + (now - self._last_refill) * self.max_rate / self.time_period)
+        self._last_refill = now
+    
+    async def acquire(self):
+        """获取一个令牌，令牌耗尽时等待到下一个令牌生成"""
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+            self._refill()
+        self._tokens -= 1
+    
+    async def __aenter__(self):
+        await self.acquire()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+_openai_rate_limiter = AsyncRateLimiter(ANALYZE_RPM, 60)
+
+async def _chat_completion(description, **kwargs):
+    """调用OpenAI ChatCompletion接口，按ANALYZE_RPM限流，触发速率限制时指数退避后重试"""
+    for attempt in range(ANALYZE_MAX_RETRIES + 1):
+        try:
+            async with _openai_rate_limiter:
+                return await openai.ChatCompletion.acreate(
+                    model=ANALYZE_MODEL, api_key=get_config().openai_api_key, **kwargs)
+        except openai.error.RateLimitError:
+            if attempt == ANALYZE_MAX_RETRIES:
+                raise
+            delay = 2 ** (attempt + 1)
+            logger.warning(f"触发OpenAI速率限制，{delay}秒后重试: {description}")
+            await asyncio.sleep(delay)
+
+def _analysis_cache_path(request):
+    """根据模型和缓存键内容计算缓存文件路径"""
+    payload = json.dumps({"model": ANALYZE_MODEL, **request}, sort_keys=True, ensure_ascii=False)
+    return ANALYSIS_CACHE_DIR / f"{hashlib.sha256(payload.encode('utf-8')).hexdigest()}.md"
+
+def _read_cached_analysis(cache_path):
+    """读取未过期的缓存结果，不存在或已过期时返回None，过期的缓存文件同时删除"""
     try:
-        # 从Author对象中提取作者名
-        author_names = [author.name for author in paper.authors]
-        
-        prompt = f"""
-        Paper Title: {paper.title}
-        Authors: {', '.join(author_names)}
-        Categories: {', '.join(paper.categories)}
-        Published: {paper.published}
-        
-        Please analyze this research paper and provide a CONCISE review in the following structured format. Keep each section brief and focused:
+        if time.time() - cache_path.stat().st_mtime > ANALYSIS_CACHE_TTL:
+            cache_path.unlink(missing_ok=True)
+            return None
+        return cache_path.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None
 
-        #### Executive Summary
-        Write 2-3 sentences summarizing the core problem, approach, and main result.
+def _prune_analysis_cache():
+    """删除缓存目录中已过期的分析结果，避免缓存目录（及Actions中保存的缓存）无限增长"""
+    if not ANALYSIS_CACHE_DIR.exists():
+        return
+    
+    expire_before = time.time() - ANALYSIS_CACHE_TTL
+    removed = 0
+    for cache_path in ANALYSIS_CACHE_DIR.iterdir():
+        try:
+            if cache_path.is_file() and cache_path.stat().st_mtime < expire_before:
+                cache_path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.error(f"删除过期分析缓存失败 {cache_path}: {str(e)}")
+    if removed:
+        logger.info(f"已删除{removed}个过期分析缓存")
 
-        ### Key Contributions
-        - List 2-3 main contributions (one line each)
-        - Focus on what's genuinely novel
+def _write_cached_analysis(cache_path, content):
+    """通过临时文件+重命名原子地写入缓存"""
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.error(f"写入分析缓存失败 {cache_path}: {str(e)}")
 
-        ### Method & Results
-        - Core methodology in 1-2 bullet points
-        - Key datasets/tools used (if any)
-        - Main experimental results (quantitative when possible)
-        - Performance compared to baselines (if reported)
+def _paper_metadata(paper):
+    """提取用于提示词的论文元信息"""
+    return {
+        "id": paper.get_short_id(),
+        "title": paper.title,
+        "authors": format_authors(paper),
+        "categories": ', '.join(paper.categories),
+        "published": str(paper.published),
+        "abstract": " ".join(paper.summary.split()),
+    }
 
-        ### Impact & Limitations
-        - Practical significance (1-2 sentences)
-        - Main limitations or future work directions (1-2 points)
+def _paper_cache_path(paper):
+    """单篇论文分析结果的缓存路径，由模型、提示词和论文元信息决定
+    
+    批量分析与逐篇分析共用同一缓存，批量请求部分命中时只需请求缺失的论文
+    """
+    return _analysis_cache_path({
+        "system": ANALYSIS_SYSTEM_PROMPT,
+        "format": ANALYSIS_FORMAT_PROMPT,
+        "paper": _paper_metadata(paper),
+    })
 
-        Keep the entire analysis under 200 words. Be precise and avoid redundancy. Use bullet points for clarity.
-        """
+async def analyze_paper_with_chatgpt(paper):
+    """使用ChatGPT API异步分析单篇论文（使用OpenAI 0.28.0兼容格式）"""
+    try:
+        cache_path = _paper_cache_path(paper)
+        analysis = _read_cached_analysis(cache_path)
+        if analysis is not None:
+            logger.info(f"命中分析缓存: {paper.title}")
+            return analysis
+        
+        metadata = _paper_metadata(paper)
+        prompt = f"""
+Paper Title: {metadata['title']}
+Authors: {metadata['authors']}
+Categories: {metadata['categories']}
+Published: {metadata['published']}
+Abstract: {metadata['abstract']}
+
+Please analyze this research paper and provide a CONCISE review in the following structured format. Keep each section brief and focused:
+
+{ANALYSIS_FORMAT_PROMPT}
+"""
         
         logger.info(f"正在分析论文: {paper.title}")
-        response = openai.ChatCompletion.create(
-            model="gpt-4.1-mini",
+        response = await _chat_completion(
+            paper.title,
             messages=[
-                {"role": "system", "content": "You are a research assistant specialized in summarizing and analyzing academic papers. Please provide structured, comprehensive analysis in English."},
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt},
             ]
         )
-        
         analysis = response.choices[0].message.content
+        if analysis:
+            _write_cached_analysis(cache_path, analysis)
+        
         logger.info(f"论文分析完成: {paper.title}")
         return analysis
     except Exception as e:
         logger.error(f"分析论文失败 {paper.title}: {str(e)}")
         return f"**Paper Analysis Error**: {str(e)}"
 
+async def analyze_papers_batch(papers):
+    """在一次ChatGPT请求中分析多篇论文，返回与papers顺序一致的分析结果列表
+    
+    已有缓存的论文直接复用，只请求缺失的论文；响应缺失或不符合结构化输出格式的论文会回退为逐篇分析，
+    接口错误（如重试耗尽的速率限制）则直接返回错误信息，不再逐篇请求
+    """
+    analyses = {}
+    for paper in papers:
+        cached = _read_cached_analysis(_paper_cache_path(paper))
+        if cached is not None:
+            analyses[paper.get_short_id()] = cached
+    requested = [paper for paper in papers if paper.get_short_id() not in analyses]
+    if analyses:
+        logger.info(f"命中分析缓存{len(analyses)}篇论文，其余{len(requested)}篇需要请求")
+    if not requested:
+        return [analyses[paper.get_short_id()] for paper in papers]
+    
+    prompt = f"""
+The JSON array below lists {len(requested)} research papers. Analyze EACH paper separately and provide a CONCISE review of it in the following structured Markdown format. Keep each section brief and focused:
+
+{ANALYSIS_FORMAT_PROMPT}
+
+Return one entry per paper in "analyses", with "id" copied from the input and "analysis" holding the Markdown review.
+
+Papers:
+{json.dumps([_paper_metadata(paper) for paper in requested], ensure_ascii=False, indent=2)}
+"""
+    
+    logger.info(f"正在批量分析{len(requested)}篇论文")
+    try:
+        response = await _chat_completion(
+            f"{len(requested)}篇论文的批量分析",
+            messages=[
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            response_format=ANALYSIS_BATCH_RESPONSE_FORMAT,
+        )
+    except Exception as e:
+        # 速率限制（重试耗尽）、认证、网络等接口错误不回退为逐篇请求，避免在限流时成倍增加请求数
+        logger.error(f"批量分析论文失败: {str(e)}")
+        for paper in requested:
+            analyses[paper.get_short_id()] = f"**Paper Analysis Error**: {str(e)}"
+        return [analyses[paper.get_short_id()] for paper in papers]
+    
+    try:
+        returned = {item["id"]: item["analysis"]
+                    for item in json.loads(response.choices[0].message.content)["analyses"]}
+        # 逐篇写入缓存，只接受本次请求的论文
+        for paper in requested:
+            analysis = returned.get(paper.get_short_id())
+            if analysis:
+                analyses[paper.get_short_id()] = analysis
+                _write_cached_analysis(_paper_cache_path(paper), analysis)
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.error(f"批量分析结果不符合结构化输出格式，改为逐篇分析: {str(e)}")
+    
+    missing = [paper for paper in papers if paper.get_short_id() not in analyses]
+    if missing:
+        if analyses:
+            logger.warning(f"批量分析结果缺少{len(missing)}篇论文，改为逐篇分析")
+        fallback = await asyncio.gather(*[analyze_paper_with_chatgpt(paper) for paper in missing])
+        for paper, analysis in zip(missing, fallback):
+            analyses[paper.get_short_id()] = analysis
+    else:
+        logger.info(f"批量分析完成: {len(papers)}篇论文")
+    
+    return [analyses[paper.get_short_id()] for paper in papers]
+
+async def process_papers(pending_papers, pdf_dir=None):
+    """按批次并发分析论文，指定pdf_dir时同时将PDF下载保存到该目录
+    
+    分析只依赖arXiv返回的元信息和摘要，不需要PDF全文。
+    返回与pending_papers顺序一致的(论文, 分析结果, 领域)列表
+    """
+    _prune_analysis_cache()
+    
+    papers = [paper for paper, _ in pending_papers]
+    semaphore = asyncio.Semaphore(ANALYZE_CONCURRENCY)
+    
+    async def bounded_analyze(batch):
+        async with semaphore:
+            return await analyze_papers_batch(batch)
+    
+    async with aiohttp.ClientSession() as openai_session:
+        # 所有OpenAI请求复用同一个会话的连接池（openai 0.28通过aiosession上下文变量读取会话）
+        openai.aiosession.set(openai_session)
+        batches = [papers[i:i + ANALYZE_BATCH_SIZE] for i in range(0, len(papers), ANALYZE_BATCH_SIZE)]
+        analyze_task = asyncio.gather(*[bounded_analyze(batch) for batch in batches])
+        
+        if pdf_dir is not None:
+            await download_papers(papers, pdf_dir)
+        batch_analyses = await analyze_task
+    
+    analyses = itertools.chain.from_iterable(batch_analyses)
+    return [(paper, analysis, domain_name)  # 添加领域标识
+            for (paper, domain_name), analysis in zip(pending_papers, analyses)]
+
+def strip_version(paper_id):
+    """去除论文ID的版本号后缀（如 2507.05245v1 -> 2507.05245），没有版本号时原样返回"""
+    base, sep, version = paper_id.rpartition('v')
+    return base if sep and version.isdigit() else paper_id
+
+def _iter_conclusion_entries(f):
+    """逐行读取conclusion.md，依次产出(条目标题, 条目内容行列表)，文件头部的标题为None
+    
+    条目以"### "开头的行分隔，紧跟在另一个标题行之后的标题行视为条目内容
+    """
+    title, lines = None, []
+    previous_is_header = True  # 文件首行之前没有换行符，不作为条目标题
+    for line in f:
+        is_header = (not previous_is_header and line.startswith("### ")
+                     and line.endswith("\n") and len(line) > len("### \n"))
+        if is_header:
+            yield title, lines
+            title, lines = line[len("### "):-1], []
+        else:
+            lines.append(line)
+        previous_is_header = is_header
+    yield title, lines
+
 def clean_duplicate_entries():
     """清理conclusion.md中的重复条目"""
     if not CONCLUSION_FILE.exists():
         logger.info("conclusion.md文件不存在，无需清理")
         return
     
+    tmp_path = None
     try:
-        with open(CONCLUSION_FILE, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 分割为不同的论文条目
-        import re
-        sections = re.split(r'\n### (.+?)\n', content)
-        
-        # 第一个section是文件头部，保留
-        cleaned_content = sections[0] if sections else ""
-        
         seen_papers = set()
+        duplicate_count = 0
         
-        # 处理每个论文条目
-        for i in range(1, len(sections), 2):
-            if i + 1 < len(sections):
-                paper_title = sections[i].strip()
-                paper_content = sections[i + 1]
-                
-                # 提取论文ID
-                arxiv_match = re.search(r'https?://arxiv\.org/abs/([^)\s\n]+)', paper_content)
-                if arxiv_match:
-                    paper_id = arxiv_match.group(1)
-                    paper_id_no_version = re.sub(r'v\d+$', '', paper_id)
+        # 逐条目流式处理，去重后的内容写入同目录下的临时文件
+        with open(CONCLUSION_FILE, 'r', encoding='utf-8') as src, \
+                tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=CONCLUSION_FILE.parent,
+                                            suffix='.tmp', delete=False) as tmp:
+            tmp_path = tmp.name
+            for paper_title, lines in _iter_conclusion_entries(src):
+                # 第一个条目之前是文件头部，保留
+                if paper_title is not None:
+                    paper_title = paper_title.strip()
                     
-                    # 检查是否已处理过
-                    if paper_id not in seen_papers and paper_id_no_version not in seen_papers:
+                    # 提取论文ID
+                    arxiv_match = next(filter(None, map(_ARXIV_LINK_RE.search, lines)), None)
+                    if arxiv_match:
+                        # 统一使用去除版本号的ID判断重复
+                        paper_id = strip_version(arxiv_match.group(1))
+                        
+                        # 检查是否已处理过
+                        if paper_id in seen_papers:
+                            logger.info(f"发现重复论文，已移除: {paper_title}")
+                            duplicate_count += 1
+                            continue
                         seen_papers.add(paper_id)
-                        seen_papers.add(paper_id_no_version)
-                        cleaned_content += f"\n### {paper_title}\n{paper_content}"
-                    else:
-                        logger.info(f"发现重复论文，已移除: {paper_title}")
-                else:
-                    # 如果没有找到arxiv链接，保留条目
-                    cleaned_content += f"\n### {paper_title}\n{paper_content}"
+                    
+                    # 没有arxiv链接的条目同样保留
+                    tmp.write(f"### {paper_title}\n")
+                tmp.writelines(lines)
         
-        # 写回文件
-        with open(CONCLUSION_FILE, 'w', encoding='utf-8') as f:
-            f.write(cleaned_content)
+        # 只有存在重复条目时才替换原文件
+        if duplicate_count:
+            # 临时文件默认权限为0600，沿用原文件权限
+            shutil.copymode(CONCLUSION_FILE, tmp_path)
+            os.replace(tmp_path, CONCLUSION_FILE)
             
         logger.info("重复条目清理完成")
         
     except Exception as e:
         logger.error(f"清理重复条目时出错: {str(e)}")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+@functools.lru_cache(maxsize=1)
+def _load_analyzed_ids(mtime_ns):
+    """逐行扫描conclusion.md，返回其中出现的所有论文ID（去除版本号后的规范形式）
+    
+    以文件修改时间作为缓存键，文件未变化时直接复用上一次的扫描结果
+    """
+    analyzed_ids = set()
+    with open(CONCLUSION_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            # 匹配arxiv链接 (http和https都支持) 和直接的paper ID格式
+            for link_id, plain_id in _PAPER_REF_RE.findall(line):
+                # 去除版本号后缀，统一格式（如 2507.05245v1 -> 2507.05245）
+                analyzed_ids.add(strip_version(link_id or plain_id))
+    return frozenset(analyzed_ids)
+
+def _write_analyzed_index(analyzed_ids):
+    """通过临时文件+重命名原子地写入已分析论文ID索引"""
+    tmp_path = ANALYZED_INDEX_FILE.with_name(ANALYZED_INDEX_FILE.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(analyzed_ids), f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, ANALYZED_INDEX_FILE)
 
 def get_analyzed_papers():
-    """获取已分析过的论文ID列表"""
-    if not CONCLUSION_FILE.exists():
-        return set()
+    """获取已分析过的论文ID集合（frozenset，元素为去除版本号后的规范ID）
     
-    analyzed_papers = set()
-    try:
-        with open(CONCLUSION_FILE, 'r', encoding='utf-8') as f:
-            content = f.read()
-            import re
-            
-            # 匹配所有arxiv链接格式 (http和https都支持)
-            arxiv_links = re.findall(r'https?://arxiv\.org/abs/([^)\s\n]+)', content)
-            analyzed_papers.update(arxiv_links)
-            
-            # 也匹配直接的paper ID格式
-            paper_ids = re.findall(r'arxiv:([^)\s\n]+)', content)
-            analyzed_papers.update(paper_ids)
-            
-            # 去除版本号后缀，统一格式（如 2507.05245v1 -> 2507.05245）
-            normalized_ids = set()
-            for paper_id in analyzed_papers:
-                # 移除版本号后缀 (如 v1, v2 等)
-                normalized_id = re.sub(r'v\d+$', '', paper_id)
-                normalized_ids.add(normalized_id)
-                # 同时保留原始ID
-                normalized_ids.add(paper_id)
-            
-            analyzed_papers = normalized_ids
-            
-    except Exception as e:
-        logger.error(f"读取已分析论文列表时出错: {str(e)}")
-        return set()
+    优先读取ANALYZED_INDEX_FILE索引；索引不存在或无法读取时扫描conclusion.md重建并保存索引。
+    重建也失败时返回None，调用方应停止运行，避免重复分析并用空集合覆盖索引
+    """
+    analyzed_papers = None
+    if ANALYZED_INDEX_FILE.exists():
+        try:
+            with open(ANALYZED_INDEX_FILE, 'r', encoding='utf-8') as f:
+                # 兼容旧索引中同时保存的带版本号ID
+                analyzed_papers = frozenset(map(strip_version, json.load(f)))
+        except Exception as e:
+            logger.error(f"读取已分析论文索引时出错，从{CONCLUSION_FILE}重建: {str(e)}")
+    elif CONCLUSION_FILE.exists():
+        logger.info(f"未找到已分析论文索引，从{CONCLUSION_FILE}重建")
+    else:
+        return frozenset()
+    
+    if analyzed_papers is None:
+        if not CONCLUSION_FILE.exists():
+            logger.error(f"已分析论文索引损坏且{CONCLUSION_FILE}不存在，无法重建索引")
+            return None
+        try:
+            analyzed_papers = _load_analyzed_ids(CONCLUSION_FILE.stat().st_mtime_ns)
+        except Exception as e:
+            logger.error(f"从{CONCLUSION_FILE}重建已分析论文列表时出错: {str(e)}")
+            return None
+        try:
+            _write_analyzed_index(analyzed_papers)
+        except Exception as e:
+            logger.error(f"保存已分析论文索引时出错: {str(e)}")
     
     logger.info(f"已分析过的论文数量: {len(analyzed_papers)}")
     if analyzed_papers:
         logger.info(f"已分析论文ID示例: {list(analyzed_papers)[:3]}")
     return analyzed_papers
 
+def rebuild_index():
+    """维护命令：清理conclusion.md中的重复条目，并据此重建已分析论文索引"""
+    if not CONCLUSION_FILE.exists():
+        logger.info("conclusion.md文件不存在，无需重建索引")
+        return
+    
+    clean_duplicate_entries()
+    try:
+        analyzed_ids = _load_analyzed_ids(CONCLUSION_FILE.stat().st_mtime_ns)
+        _write_analyzed_index(analyzed_ids)
+        logger.info(f"已从{CONCLUSION_FILE}重建索引，共{len(analyzed_ids)}个论文ID")
+    except Exception as e:
+        logger.error(f"重建已分析论文索引时出错: {str(e)}")
+
+def record_analyzed_papers(analyzed_papers, papers):
+    """将新写入conclusion.md的论文ID加入索引，返回更新后的ID集合"""
+    updated = set(analyzed_papers)
+    updated.update(strip_version(paper.get_short_id()) for paper in papers)
+    
+    try:
+        _write_analyzed_index(updated)
+        logger.info(f"已分析论文索引已更新: {ANALYZED_INDEX_FILE}")
+    except Exception as e:
+        logger.error(f"更新已分析论文索引时出错: {str(e)}")
+    return frozenset(updated)
+
+def _append_or_rollback(path, content):
+    """向文件末尾追加内容，写入失败时截断回追加前的长度
+    
+    只写入新增内容，不重写已有内容；不经过Python缓冲区直接写入，
+    中途失败时在系统层面截断，不会在文件末尾留下不完整的条目
+    """
+    data = content.encode('utf-8')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        offset = os.lseek(fd, 0, os.SEEK_END)
+        try:
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            os.fsync(fd)
+        except BaseException:
+            os.ftruncate(fd, offset)
+            raise
+    finally:
+        os.close(fd)
+
 def write_to_conclusion(papers_analyses):
     """将分析结果写入conclusion.md"""
     today = datetime.datetime.now().strftime('%Y-%m-%d')
     
-    # 创建或追加到结果文件
-    with open(CONCLUSION_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"\n\n## ArXiv论文 - 最近7天 (截至 {today})\n\n")
-        
-        for paper, analysis in papers_analyses:
-            # 从Author对象中提取作者名
-            author_names = [author.name for author in paper.authors]
-            
-            f.write(f"### {paper.title}\n")
-            f.write(f"**作者**: {', '.join(author_names)}\n")
-            f.write(f"**类别**: {', '.join(paper.categories)}\n")
-            f.write(f"**发布日期**: {paper.published.strftime('%Y-%m-%d')}\n")
-            f.write(f"**链接**: {paper.entry_id}\n\n")
-            f.write(f"{analysis}\n\n")
-            f.write("---\n\n")
+    parts = [f"\n\n## ArXiv论文 - 最近7天 (截至 {today})\n\n"]
+    for paper, analysis in papers_analyses:
+        parts.append(
+            f"### {paper.title}\n"
+            f"**作者**: {format_authors(paper)}\n"
+            f"**类别**: {', '.join(paper.categories)}\n"
+            f"**发布日期**: {paper.published.strftime('%Y-%m-%d')}\n"
+            f"**链接**: {paper.entry_id}\n\n"
+            f"{analysis}\n\n"
+            "---\n\n"
+        )
+    
+    # 创建或追加到结果文件，一次性写入
+    _append_or_rollback(CONCLUSION_FILE, "".join(parts))
     
     logger.info(f"分析结果已写入 {CONCLUSION_FILE}")
 
@@ -301,60 +830,25 @@ def format_email_content(papers_analyses):
     """格式化邮件内容，只包含当天分析的论文"""
     today = datetime.datetime.now().strftime('%Y-%m-%d')
     
-    content = f"# ArXiv Paper Analysis Report ({today})\n\n"
+    parts = [f"# ArXiv Paper Analysis Report ({today})\n\n"]
     
     for paper, analysis in papers_analyses:
-        # 从Author对象中提取作者名
-        author_names = [author.name for author in paper.authors]
-        
-        content += f"## {paper.title}\n\n"
-        content += f"**Authors**: {', '.join(author_names)}\n"
-        content += f"**Categories**: {', '.join(paper.categories)}\n"
-        content += f"**Published**: {paper.published.strftime('%Y-%m-%d')}\n"
-        content += f"**ArXiv Link**: {paper.entry_id}\n\n"
-        content += f"{analysis}\n\n"
-        content += "---\n\n"
-    
-    return content
-
-def write_to_conclusion_with_domains(papers_analyses):
-    """将分析结果按领域写入conclusion.md"""
-    today = datetime.datetime.now().strftime('%Y-%m-%d')
-    
-    # 按领域组织论文
-    domain_papers = {}
-    for paper, analysis, domain in papers_analyses:
-        if domain not in domain_papers:
-            domain_papers[domain] = []
-        domain_papers[domain].append((paper, analysis))
-    
-    # 创建或追加到结果文件
-    with open(CONCLUSION_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"\n\n## ArXiv论文 - 最近7天 (截至 {today})\n\n")
-        
-        for domain, papers in domain_papers.items():
-            f.write(f"### {domain} 领域\n\n")
-            
-            for paper, analysis in papers:
-                # 从Author对象中提取作者名
-                author_names = [author.name for author in paper.authors]
-                
-                f.write(f"#### {paper.title}\n")
-                f.write(f"**作者**: {', '.join(author_names)}\n")
-                f.write(f"**类别**: {', '.join(paper.categories)}\n")
-                f.write(f"**发布日期**: {paper.published.strftime('%Y-%m-%d')}\n")
-                f.write(f"**链接**: {paper.entry_id}\n\n")
-                f.write(f"{analysis}\n\n")
-                f.write("---\n\n")
+        parts.append(
+            f"## {paper.title}\n\n"
+            f"**Authors**: {format_authors(paper)}\n"
+            f"**Categories**: {', '.join(paper.categories)}\n"
+            f"**Published**: {paper.published.strftime('%Y-%m-%d')}\n"
+            f"**ArXiv Link**: {paper.entry_id}\n\n"
+            f"{analysis}\n\n"
+            "---\n\n"
+        )
     
-    logger.info(f"分析结果已写入 {CONCLUSION_FILE}")
+    return "".join(parts)
 
-def format_email_content_with_domains(papers_analyses):
-    """按领域格式化邮件内容"""
+def render_outputs(papers_analyses):
+    """一次遍历按领域生成两份Markdown：(写入conclusion.md的内容, 邮件内容)"""
     today = datetime.datetime.now().strftime('%Y-%m-%d')
     
-    content = f"# ArXiv Paper Analysis Report ({today})\n\n"
-    
     # 按领域组织论文
     domain_papers = {}
     for paper, analysis, domain in papers_analyses:
@@ -362,208 +856,128 @@ def format_email_content_with_domains(papers_analyses):
             domain_papers[domain] = []
         domain_papers[domain].append((paper, analysis))
     
+    file_parts = [f"\n\n## ArXiv论文 - 最近7天 (截至 {today})\n\n"]
+    email_parts = [f"# ArXiv Paper Analysis Report ({today})\n\n"]
     for domain, papers in domain_papers.items():
-        content += f"## {domain} 领域\n\n"
+        file_parts.append(f"### {domain} 领域\n\n")
+        email_parts.append(f"## {domain} 领域\n\n")
         
         for paper, analysis in papers:
-            # 从Author对象中提取作者名
-            author_names = [author.name for author in paper.authors]
+            authors = format_authors(paper)
+            categories = ', '.join(paper.categories)
+            published = paper.published.strftime('%Y-%m-%d')
             
-            content += f"### {paper.title}\n\n"
-            content += f"**Authors**: {', '.join(author_names)}\n"
-            content += f"**Categories**: {', '.join(paper.categories)}\n"
-            content += f"**Published**: {paper.published.strftime('%Y-%m-%d')}\n"
-            content += f"**ArXiv Link**: {paper.entry_id}\n\n"
-            content += f"{analysis}\n\n"
-            content += "---\n\n"
-    
-    return content
-
-def delete_pdf(pdf_path):
-    """删除PDF文件"""
-    try:
-        if pdf_path.exists():
-            pdf_path.unlink()
-            logger.info(f"已删除PDF文件: {pdf_path}")
-        else:
-            logger.info(f"PDF文件不存在，无需删除: {pdf_path}")
-    except Exception as e:
-        logger.error(f"删除PDF文件失败 {pdf_path}: {str(e)}")
+            file_parts.append(
+                f"#### {paper.title}\n"
+                f"**作者**: {authors}\n"
+                f"**类别**: {categories}\n"
+                f"**发布日期**: {published}\n"
+                f"**链接**: {paper.entry_id}\n\n"
+                f"{analysis}\n\n"
+                "---\n\n"
+            )
+            email_parts.append(
+                f"### {paper.title}\n\n"
+                f"**Authors**: {authors}\n"
+                f"**Categories**: {categories}\n"
+                f"**Published**: {published}\n"
+                f"**ArXiv Link**: {paper.entry_id}\n\n"
+                f"{analysis}\n\n"
+                "---\n\n"
+            )
+    
+    return "".join(file_parts), "".join(email_parts)
+
+def append_to_conclusion(content):
+    """将render_outputs生成的内容一次性追加到conclusion.md"""
+    _append_or_rollback(CONCLUSION_FILE, content)
+    
+    logger.info(f"分析结果已写入 {CONCLUSION_FILE}")
+
+@contextlib.contextmanager
+def smtp_session():
+    """建立已登录的SMTP连接，可在多次send_email调用之间复用"""
+    config = get_config()
+    if config.smtp_use_ssl:
+        with smtplib.SMTP_SSL(config.smtp_server, config.smtp_port) as server:
+            server.login(config.smtp_username, config.smtp_password)
+            yield server
+    else:
+        with smtplib.SMTP(config.smtp_server, config.smtp_port) as server:
+            server.starttls()
+            server.login(config.smtp_username, config.smtp_password)
+            yield server
 
-def send_email(content):
-    """发送邮件，支持多个收件人"""
-    if not all([SMTP_SERVER, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD, EMAIL_FROM]) or not EMAIL_TO:
+def send_email(content, server=None):
+    """发送邮件，支持多个收件人
+    
+    传入server时复用已有的SMTP连接，否则为本次发送单独建立连接
+    """
+    config = get_config()
+    if not all([config.smtp_server, config.smtp_port, config.smtp_username,
+                config.smtp_password, config.email_from]) or not config.email_to:
         logger.error("邮件配置不完整，跳过发送邮件")
         return
     
     # 确保所有必需的配置都不为None
-    if not SMTP_SERVER or not SMTP_USERNAME or not SMTP_PASSWORD or not EMAIL_FROM:
+    if not config.smtp_server or not config.smtp_username or not config.smtp_password or not config.email_from:
         logger.error("邮件配置存在空值，跳过发送邮件")
         return
 
     try:
         msg = MIMEMultipart()
-        msg['From'] = EMAIL_FROM
-        msg['To'] = ", ".join(EMAIL_TO)
+        msg['From'] = config.email_from
+        msg['To'] = ", ".join(config.email_to)
         msg['Subject'] = f"ArXiv Paper Analysis Report - {datetime.datetime.now().strftime('%Y-%m-%d')}"
 
-        # 改进的HTML模板，规范化标题样式
-        html_template = """
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <style>
-                body {
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
-                    line-height: 1.6;
-                    max-width: 1000px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: #f5f5f5;
-                    color: #333;
-                }
-                .container {
-                    background-color: white;
-                    padding: 30px;
-                    border-radius: 8px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }
-                /* 规范化标题样式 - 确保一致的字体大小 */
-                h1 {
-                    color: #2c3e50;
-                    font-size: 24px;
-                    border-bottom: 2px solid #3498db;
-                    padding-bottom: 10px;
-                    margin: 30px 0 20px 0;
-                }
-                h2 {
-                    color: #34495e;
-                    font-size: 20px;
-                    margin: 25px 0 15px 0;
-                    padding-bottom: 8px;
-                    border-bottom: 1px solid #eee;
-                }
-                h3 {
-                    color: #2980b9;
-                    font-size: 18px;
-                    margin: 20px 0 10px 0;
-                }
-                h4 {
-                    color: #2c3e50;
-                    font-size: 16px;
-                    margin: 15px 0 10px 0;
-                    font-weight: 600;
-                }
-                .paper-header {
-                    background-color: #f8f9fa;
-                    padding: 15px;
-                    border-left: 4px solid #3498db;
-                    margin: 20px 0;
-                    border-radius: 4px;
-                }
-                .paper-info {
-                    margin: 5px 0;
-                    font-size: 14px;
-                }
-                .paper-info strong {
-                    color: #2c3e50;
-                }
-                a {
-                    color: #3498db;
-                    text-decoration: none;
-                }
-                a:hover {
-                    text-decoration: underline;
-                }
-                hr {
-                    border: none;
-                    border-top: 1px solid #eee;
-                    margin: 30px 0;
-                }
-                ul, ol {
-                    margin: 10px 0;
-                    padding-left: 20px;
-                }
-                li {
-                    margin: 5px 0;
-                }
-                .section-content {
-                    margin-bottom: 20px;
-                }
-                strong {
-                    color: #2c3e50;
-                    font-weight: 600;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                {{ content }}
-            </div>
-        </body>
-        </html>
-        """
-        
-        # 改进的Markdown到HTML转换逻辑
-        content_html = content
+        # 将Markdown一次性转换为HTML（nl2br保留作者、类别等元信息的逐行显示）
+        content_html = markdown.markdown(content, extensions=['extra', 'nl2br'])
         
-        # 按顺序处理标题（从最长到最短，避免重复替换）
-        content_html = content_html.replace("#### ", "<h4>")
-        content_html = content_html.replace("### ", "<h3>")
-        content_html = content_html.replace("## ", "<h2>")
-        content_html = content_html.replace("# ", "<h1>")
-        
-        # 处理加粗文本
-        import re
-        content_html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content_html)
-        
-        # 处理列表项
-        content_html = re.sub(r'^- (.+)$', r'<li>\1</li>', content_html, flags=re.MULTILINE)
-        content_html = re.sub(r'(<li>.*</li>)', r'<ul>\1</ul>', content_html, flags=re.DOTALL)
-        
-        # 处理段落分隔
-        content_html = content_html.replace("\n\n", "</p><p>")
-        content_html = "<p>" + content_html + "</p>"
-        
-        # 处理分隔线
-        content_html = content_html.replace("---", "<hr>")
-        
-        # 修复一些HTML标签问题
-        content_html = content_html.replace("<p><h", "<h")
-        content_html = content_html.replace("</h1></p>", "</h1>")
-        content_html = content_html.replace("</h2></p>", "</h2>")
-        content_html = content_html.replace("</h3></p>", "</h3>")
-        content_html = content_html.replace("</h4></p>", "</h4>")
-        content_html = content_html.replace("<p><hr>", "<hr>")
-        content_html = content_html.replace("<hr></p>", "<hr>")
-        content_html = content_html.replace("<p><ul>", "<ul>")
-        content_html = content_html.replace("</ul></p>", "</ul>")
-        
-        template = Template(html_template)
-        html_content = template.render(content=content_html)
+        html_content = _EMAIL_TEMPLATE.render(content=content_html)
         
         msg.attach(MIMEText(html_content, 'html'))
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+        if server is None:
+            with smtp_session() as server:
+                server.send_message(msg)
+        else:
             server.send_message(msg)
 
-        logger.info(f"邮件发送成功，收件人: {', '.join(EMAIL_TO)}")
+        logger.info(f"邮件发送成功，收件人: {', '.join(config.email_to)}")
     except Exception as e:
         logger.error(f"发送邮件失败: {str(e)}")
 
-def main():
+def main(download_pdfs=False):
+    """运行论文追踪；download_pdfs为True时额外将待分析论文的PDF保存到PAPERS_DIR"""
     logger.info("开始ArXiv论文跟踪")
+    # 在开始任何工作之前解析配置，配置有误时立即停止，避免分析请求逐个失败并被记录为已分析
+    try:
+        get_config()
+    except Exception as e:
+        logger.error(f"读取配置失败，停止本次运行: {str(e)}")
+        return
+    logger.info(f"分析结果将写入: {CONCLUSION_FILE.absolute()}")
     
-    # 清理重复条目
-    clean_duplicate_entries()
+    if download_pdfs:
+        # 如果不存在论文目录则创建
+        PAPERS_DIR.mkdir(exist_ok=True)
+        logger.info(f"论文将保存在: {PAPERS_DIR.absolute()}")
     
     # 获取已分析过的论文ID列表
     analyzed_papers = get_analyzed_papers()
+    if analyzed_papers is None:
+        logger.error("无法获取已分析论文列表，停止本次运行以免重复分析")
+        return
     
     all_papers_analyses = []  # 存储所有领域的分析结果
+    pending_papers = []  # 存储所有领域待分析的(论文, 领域)
+    queued_ids = set()  # 本次已加入待分析队列的论文ID，避免跨领域重复分析和写入
+    
+    # 合并所有领域的类别，只向arXiv发起一次查询，再按领域分组
+    all_categories = list(dict.fromkeys(
+        category for config in CATEGORY_CONFIGS.values() for category in config["categories"]))
+    total_search = sum(config["max_search"] for config in CATEGORY_CONFIGS.values())
+    all_papers = get_recent_papers(all_categories, total_search)
     
     # 分别处理每个领域
     for domain_name, config in CATEGORY_CONFIGS.items():
@@ -575,8 +989,9 @@ def main():
         logger.info(f"类别: {', '.join(categories)}")
         logger.info(f"搜索配置: 搜索{max_search}篇，分析{max_analyze}篇")
         
-        # 获取该领域最近7天的论文
-        papers = get_recent_papers(categories, max_search)
+        # 从合并查询结果中筛选该领域最近7天的论文
+        domain_categories = set(categories)
+        papers = [paper for paper in all_papers if domain_categories.intersection(paper.categories)][:max_search]
         logger.info(f"{domain_name}领域从最近7天找到{len(papers)}篇论文")
         
         if not papers:
@@ -587,20 +1002,18 @@ def main():
         new_papers = []
         for paper in papers:
             paper_id = paper.get_short_id()
+            paper_id_no_version = strip_version(paper_id)  # 移除版本号
             
-            # 检查多种格式的匹配
-            import re
-            paper_id_no_version = re.sub(r'v\d+$', '', paper_id)  # 移除版本号
-            
-            # 检查是否已分析过（检查原始ID、无版本号ID）
-            is_analyzed = (paper_id in analyzed_papers or 
-                          paper_id_no_version in analyzed_papers)
+            # 索引中只保存无版本号ID，一次查找即可判断是否已分析过
+            is_analyzed = paper_id_no_version in analyzed_papers
             
-            if not is_analyzed:
+            if is_analyzed:
+                logger.info(f"{domain_name}论文已分析过，跳过: {paper.title} ({paper_id})")
+            elif paper_id_no_version in queued_ids:
+                logger.info(f"{domain_name}论文已在其他领域待分析，跳过: {paper.title} ({paper_id})")
+            else:
                 new_papers.append(paper)
                 logger.info(f"{domain_name}新论文待分析: {paper.title} ({paper_id})")
-            else:
-                logger.info(f"{domain_name}论文已分析过，跳过: {paper.title} ({paper_id})")
         
         # 按发布时间排序新论文（最新的在前）
         new_papers.sort(key=lambda p: p.published, reverse=True)
@@ -618,24 +1031,8 @@ def main():
             logger.info(f"{domain_name}领域没有新论文需要分析")
             continue
         
-        # 处理该领域的每篇新论文
-        domain_analyses = []
-        for i, paper in enumerate(papers_to_analyze, 1):
-            logger.info(f"正在处理{domain_name}论文 {i}/{len(papers_to_analyze)}: {paper.title}")
-            # 下载论文
-            pdf_path = download_paper(paper, PAPERS_DIR)
-            if pdf_path:
-                # 休眠以避免达到API速率限制
-                time.sleep(2)
-                
-                # 分析论文
-                analysis = analyze_paper_with_chatgpt(pdf_path, paper)
-                domain_analyses.append((paper, analysis, domain_name))  # 添加领域标识
-                
-                # 分析完成后删除PDF文件
-                delete_pdf(pdf_path)
-        
-        all_papers_analyses.extend(domain_analyses)
+        pending_papers.extend((paper, domain_name) for paper in papers_to_analyze)
+        queued_ids.update(strip_version(paper.get_short_id()) for paper in papers_to_analyze)
         
         # 显示该领域待分析论文队列状态
         remaining_papers = new_papers[max_analyze:]
@@ -648,12 +1045,19 @@ def main():
         
         logger.info(f"=== {domain_name} 领域处理完成 ===\n")
     
+    if pending_papers:
+        logger.info(f"开始分析{len(pending_papers)}篇论文")
+        all_papers_analyses = asyncio.run(
+            process_papers(pending_papers, PAPERS_DIR if download_pdfs else None))
+    
     # 将所有领域的分析结果写入conclusion.md
     if all_papers_analyses:
-        write_to_conclusion_with_domains(all_papers_analyses)
+        conclusion_content, email_content = render_outputs(all_papers_analyses)
+        append_to_conclusion(conclusion_content)
+        analyzed_papers = record_analyzed_papers(
+            analyzed_papers, [paper for paper, _, _ in all_papers_analyses])
         
         # 发送邮件（包含所有领域当天分析的论文）
-        email_content = format_email_content_with_domains(all_papers_analyses)
         send_email(email_content)
         
         logger.info("ArXiv论文追踪和分析完成")
@@ -746,7 +1150,7 @@ def test_configuration_and_functions():
     # 4. 测试邮件内容格式化
     print(f"\n4. 测试邮件内容格式化:")
     try:
-        email_content = format_email_content_with_domains(test_analyses)
+        _, email_content = render_outputs(test_analyses)
         print("   ✓ 邮件格式化成功")
         print(f"   邮件内容长度: {len(email_content)} 字符")
         
@@ -774,15 +1178,19 @@ def test_configuration_and_functions():
     test_paper_ids = ["2024.01001", "2024.01002v1", "2024.01003"]
     analyzed_papers = {"2024.01001", "2024.01002"}  # 模拟已分析的论文
     
-    import re
     for paper_id in test_paper_ids:
-        paper_id_no_version = re.sub(r'v\d+$', '', paper_id)
-        is_analyzed = (paper_id in analyzed_papers or paper_id_no_version in analyzed_papers)
+        paper_id_no_version = strip_version(paper_id)
+        is_analyzed = paper_id_no_version in analyzed_papers
         status = "已分析" if is_analyzed else "待分析"
         print(f"   论文 {paper_id} -> {paper_id_no_version}: {status}")
     
     # 7. 测试环境变量检查
     print(f"\n7. 测试环境变量:")
+    try:
+        get_config()  # 加载.env中的环境变量
+        print("   ✓ 配置解析成功")
+    except Exception as e:
+        print(f"   ✗ 配置解析失败: {e}")
     required_vars = ["OPENAI_API_KEY", "SMTP_SERVER", "SMTP_USERNAME", "SMTP_PASSWORD", "EMAIL_FROM", "EMAIL_TO"]
     for var in required_vars:
         value = os.getenv(var)
@@ -797,5 +1205,7 @@ if __name__ == "__main__":
     # 检查命令行参数
     if len(sys.argv) > 1 and sys.argv[1] == "--test":
         test_configuration_and_functions()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--rebuild-index":
+        rebuild_index()
     else:
-        main()
+        main(download_pdfs="--download-pdfs" in sys.argv)